@@ -1,9 +1,14 @@
 import os
 import time
+import json
+import select
 import psycopg2
+import psycopg2.errors
+import psycopg2.pool
 import asyncio
+from collections import deque
 from datetime import datetime, timezone
-from telegram import Bot
+from aiolimiter import AsyncLimiter
 
 # --- ГЛАВНАЯ КОНФИГУРАЦИЯ ---
 DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -14,113 +19,421 @@ TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID')
 # Сравниваться будет ИЗМЕНЕНИЕ (дельта) роста OI
 OI_DELTA_THRESHOLD = float(os.environ.get('OI_DELTA_THRESHOLD', 10.0))
 
-# Как часто бот будет проверять базу данных
+# Шаблон текста алерта (Markdown)
+ALERT_TMPL = (
+    "🚀 *Алерт по УСКОРЕНИЮ роста OI* 🚀\n\n"
+    "Токен: *{name} ({sym})*\n\n"
+    "🔥 Изменение роста OI за 4 часа: *{delta:+.2f}%*\n"
+    "_(Текущий рост: {cur:.2f}%, Предыдущий: {prev:.2f}%)_"
+)
+
+# Как часто писать в лог, что бот жив и ждет сигналов, и через сколько переподключаться к БД
 CHECK_INTERVAL_SECONDS = 60 * 1 # Каждую минуту
 
+# Канал, в который сканер (oi_collect.py) отправляет NOTIFY с символом каждого записанного токена
+LISTEN_CHANNEL = 'new_data_event'
+# Сколько ждать хвост пачки сигналов перед запуском анализа
+NOTIFY_COALESCE_SECONDS = 0.05
+
+# Пул соединений с БД: создается один раз и переиспользуется между циклами
+DB_POOL_MIN_CONN = 1
+DB_POOL_MAX_CONN = 4
+POOL = None
+
+# По каждому токену берется самая новая запись и рост OI из предыдущей (LEAD в окне,
+# отсортированном от новых к старым). Дельта и сравнение с порогом ($1) считаются в БД,
+# так что возвращаются только токены, по которым нужен алерт.
+# Токены, у которых меньше двух записей, отсекаются условием prev_oi IS NOT NULL
+OI_ALERTS_QUERY_TEMPLATE = """
+    SELECT token_symbol, cur_oi, prev_oi, cur_oi - prev_oi AS oi_delta
+    FROM (
+        SELECT token_symbol, oi_growth_4h AS cur_oi,
+               LEAD(oi_growth_4h) OVER w AS prev_oi,
+               ROW_NUMBER() OVER w AS rn
+        FROM oi_data
+        {symbols_filter}
+        WINDOW w AS (PARTITION BY token_symbol ORDER BY scan_time DESC)
+    ) t
+    WHERE rn = 1 AND prev_oi IS NOT NULL AND cur_oi - prev_oi >= $1::float8
+    ORDER BY token_symbol
+"""
+
+# Запросы, которые выполняются каждый цикл, готовятся на сервере (PREPARE) один раз
+# на каждое соединение пула и дальше только исполняются (EXECUTE) без повторного разбора и планирования
+PREPARED_QUERIES = {
+    'oi_alerts': OI_ALERTS_QUERY_TEMPLATE.format(symbols_filter=""),
+    'oi_alerts_for_symbols': OI_ALERTS_QUERY_TEMPLATE.format(
+        symbols_filter="WHERE token_symbol = ANY($2::text[])"
+    ),
+}
+
+# Названия токенов почти не меняются, поэтому не читаются в каждом проходе,
+# а хранятся в памяти: {token_symbol: token_name}
+NAME_CACHE = {}
+
+# Один event loop (создается при запуске в init_telegram()) и один Bot с его HTTP-клиентом
+# на все время работы сервиса. Библиотека telegram тяжелая, поэтому Bot создается
+# (и telegram импортируется) только при первом алерте - см. get_bot()
+BOT = None
+LOOP = None
+
+# Все алерты уходят в один чат, поэтому действует лимит Telegram на чат, а не на бота:
+# около 1 сообщения в секунду в личный чат и около 20 в минуту в группу или канал
+# (их id начинается с '-' или '@'). Лимит можно задать явно через TELEGRAM_MESSAGES_PER_MINUTE.
+# Отправка идет по одному сообщению: параллельность в один чат не ускоряет доставку,
+# а так алерты приходят в исходном порядке
+TELEGRAM_CHAT_IS_GROUP = str(TELEGRAM_CHAT_ID).startswith(('-', '@'))
+TELEGRAM_MESSAGES_PER_MINUTE = int(os.environ.get('TELEGRAM_MESSAGES_PER_MINUTE', 20 if TELEGRAM_CHAT_IS_GROUP else 60))
+# Лимитер с емкостью в одно сообщение: отправки идут равномерно, без начального залпа
+TELEGRAM_RATE_LIMITER = AsyncLimiter(1, 60 / TELEGRAM_MESSAGES_PER_MINUTE)
+# Алерты отправляются последовательно, поэтому клиенту бота хватает одного
+# HTTP/2-соединения: оно переиспользуется (keep-alive) между отправками
+TELEGRAM_CONNECTION_POOL_SIZE = 1
+
+# Сколько раз пытаться отправить алерт при сетевых ошибках (паузы между попытками растут: 0.5с, 1с, ...)
+TELEGRAM_SEND_ATTEMPTS = 3
+# Алерты, которые так и не удалось отправить, сохраняются в файл (вместе со временем создания)
+# и досылаются в следующем проходе с пометкой исходного времени. После долгого сбоя Telegram
+# старые алерты уже неактуальны: они выбрасываются по возрасту, а очередь ограничена по размеру,
+# чтобы досылка не задерживала возврат анализатора к ожиданию новых данных
+FAILED_ALERTS_FILE = os.environ.get('FAILED_ALERTS_FILE', 'failed_alerts.json')
+FAILED_ALERTS_MAX_AGE_SECONDS = 60 * 60
+FAILED_ALERTS_MAX = 20
+FAILED_ALERTS = deque(maxlen=FAILED_ALERTS_MAX)
+DELAYED_ALERT_NOTE = "\n\n_⏳ Отложенный алерт от {time} UTC_"
+
 # --- ФУНКЦИИ ДЛЯ РАБОТЫ С БАЗОЙ ДАННЫХ ---
 
 def get_db_connection():
-    """Устанавливает соединение с базой данных PostgreSQL."""
+    """Берет соединение с PostgreSQL из пула (пул создается при первом вызове)."""
+    global POOL
+    try:
+        if POOL is None:
+            POOL = psycopg2.pool.ThreadedConnectionPool(
+                minconn=DB_POOL_MIN_CONN, maxconn=DB_POOL_MAX_CONN, dsn=DATABASE_URL
+            )
+        return POOL.getconn()
+    except Exception as e:
+        print(f"[DB Error] Не удалось подключиться к базе данных: {e}")
+        return None
+
+def release_db_connection(conn):
+    """Возвращает соединение в пул. Разорванные соединения пул закрывает и не выдает повторно."""
+    try:
+        POOL.putconn(conn, close=bool(conn.closed))
+    except Exception as e:
+        print(f"[DB Error] Не удалось вернуть соединение в пул: {e}")
+
+def get_listener_connection():
+    """Открывает отдельное (вне пула) соединение, подписанное на NOTIFY от сканера."""
     try:
         conn = psycopg2.connect(DATABASE_URL)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {LISTEN_CHANNEL};")
+        print(f"[DB] Подписка на канал '{LISTEN_CHANNEL}' активна.")
         return conn
     except Exception as e:
-        print(f"[DB Error] Не удалось подключиться к базе данных: {e}")
+        print(f"[DB Error] Не удалось подписаться на канал '{LISTEN_CHANNEL}': {e}")
+        return None
+
+def wait_for_new_data(listener_conn, heartbeat_seconds):
+    """Блокируется (без опроса) до прихода NOTIFY от сканера.
+
+    Сканер пишет данные порциями, поэтому сигналы приходят пачками. Все накопившиеся
+    сигналы сбрасываются разом: одного прохода анализа достаточно на всю пачку.
+    Возвращает множество символов токенов из сигналов или None, если пришел сигнал
+    без символа и нужен полный проход по всем токенам.
+    """
+    while True:
+        select.select([listener_conn], [], [], heartbeat_seconds)
+        listener_conn.poll()
+        if listener_conn.notifies:
+            break
+        print(f"[DB] {datetime.now(timezone.utc).strftime('%H:%M:%S')} | Новых данных нет, ожидание продолжается.")
+
+    # Даем немного времени долететь хвосту пачки, чтобы не запускать по нему отдельный проход
+    if select.select([listener_conn], [], [], NOTIFY_COALESCE_SECONDS)[0]:
+        listener_conn.poll()
+    symbols = {notification.payload for notification in listener_conn.notifies}
+    print(f"[DB] Получено сигналов о новых данных: {len(listener_conn.notifies)}.")
+    listener_conn.notifies[:] = []
+    if '' in symbols:
+        return None
+    return symbols
+
+def execute_prepared(cur, name, params=()):
+    """Выполняет запрос из PREPARED_QUERIES, при первом обращении на соединении готовит его (PREPARE)."""
+    placeholders = f"({', '.join(['%s'] * len(params))})" if params else ""
+    try:
+        cur.execute(f"EXECUTE {name}{placeholders};", params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # На этом соединении запрос еще не готовился - откатываем прерванную транзакцию и готовим его
+        cur.connection.rollback()
+        cur.execute(f"PREPARE {name} AS {PREPARED_QUERIES[name]};")
+        cur.execute(f"EXECUTE {name}{placeholders};", params)
+
+def get_oi_alerts(conn, symbols=None):
+    """Одним запросом сравнивает ДВЕ самые последние записи по каждому токену.
+
+    Если передан symbols, запрос ограничивается только этими токенами.
+    Возвращает только токены, у которых дельта роста OI достигла порога, - список
+    кортежей (token_symbol, текущий_рост, предыдущий_рост, дельта), или None при ошибке.
+    """
+    try:
+        with conn.cursor() as cur:
+            if symbols is None:
+                execute_prepared(cur, 'oi_alerts', (OI_DELTA_THRESHOLD,))
+            else:
+                execute_prepared(cur, 'oi_alerts_for_symbols', (OI_DELTA_THRESHOLD, sorted(symbols)))
+            return list(cur)
+    except Exception as e:
+        print(f"[DB Error] Не удалось получить последние записи токенов: {e}")
         return None
 
-def get_tokens_to_process(conn):
-    """Находит токены, у которых есть 2 или более записей для анализа."""
-    query = "SELECT token_symbol FROM oi_data GROUP BY token_symbol HAVING COUNT(*) >= 2;"
+def load_token_names(conn):
+    """Заполняет NAME_CACHE названиями всех токенов, которые есть в базе."""
     try:
         with conn.cursor() as cur:
-            cur.execute(query)
-            tokens = [item[0] for item in cur.fetchall()]
-            return tokens
+            cur.execute("SELECT DISTINCT token_symbol, token_name FROM oi_data;")
+            NAME_CACHE.update(cur)
+            print(f"[DB] Загружено названий токенов: {len(NAME_CACHE)}.")
     except Exception as e:
-        print(f"[DB Error] Не удалось получить список токенов: {e}")
-        return []
+        print(f"[DB Error] Не удалось загрузить названия токенов: {e}")
+        conn.rollback()
+
+def get_token_name(conn, token_symbol):
+    """Возвращает название токена из NAME_CACHE, при промахе дочитывает его из базы."""
+    try:
+        return NAME_CACHE[token_symbol]
+    except KeyError:
+        pass
 
-def get_latest_records(conn, token_symbol):
-    """Получает ДВЕ самые последние записи для указанного токена."""
-    query = "SELECT id, token_name, oi_growth_4h FROM oi_data WHERE token_symbol = %s ORDER BY scan_time DESC LIMIT 2;"
+    query = "SELECT token_name FROM oi_data WHERE token_symbol = %s ORDER BY scan_time DESC LIMIT 1;"
     try:
         with conn.cursor() as cur:
             cur.execute(query, (token_symbol,))
-            records = cur.fetchall()
-            if len(records) == 2:
-                # records[0] - самая новая (current)
-                # records[1] - предыдущая (previous)
-                return records[0], records[1] 
-            return None, None
+            record = cur.fetchone()
+            if record:
+                NAME_CACHE[token_symbol] = record[0]
+                return record[0]
     except Exception as e:
-        print(f"[DB Error] Не удалось получить записи для {token_symbol}: {e}")
-        return None, None
+        print(f"[DB Error] Не удалось получить название для {token_symbol}: {e}")
+        conn.rollback()
+    return token_symbol
+
+def cleanup_all(conn, symbols=None):
+    """Одним запросом удаляет для каждого токена все записи, КРОМЕ самой новой.
 
-def cleanup_old_records(conn, newest_record_id, token_symbol):
-    """Удаляет все записи для токена, КРОМЕ самой новой."""
-    query = "DELETE FROM oi_data WHERE token_symbol = %s AND id != %s;"
+    Если передан symbols, чистятся только записи этих токенов.
+    """
+    query = """
+        WITH keep AS (
+            SELECT DISTINCT ON (token_symbol) id
+            FROM oi_data
+            WHERE %(symbols)s::text[] IS NULL OR token_symbol = ANY(%(symbols)s::text[])
+            ORDER BY token_symbol, scan_time DESC
+        )
+        DELETE FROM oi_data
+        WHERE (%(symbols)s::text[] IS NULL OR token_symbol = ANY(%(symbols)s::text[]))
+          AND id NOT IN (SELECT id FROM keep);
+    """
     try:
         with conn.cursor() as cur:
-            cur.execute(query, (token_symbol, newest_record_id))
+            cur.execute(query, {'symbols': sorted(symbols) if symbols is not None else None})
             deleted_count = cur.rowcount
             conn.commit()
             if deleted_count > 0:
-                print(f"[DB] Успешно удалено {deleted_count} старых записей для {token_symbol}.")
+                print(f"[DB] Успешно удалено {deleted_count} старых записей.")
     except Exception as e:
-        print(f"[DB Error] Не удалось удалить старые записи для {token_symbol}: {e}")
+        print(f"[DB Error] Не удалось удалить старые записи: {e}")
         conn.rollback()
 
 # --- ФУНКЦИЯ ДЛЯ ОТПРАВКИ В TELEGRAM ---
 
-async def send_telegram_alert(message):
-    """Асинхронно отправляет сообщение в Telegram."""
+def init_telegram():
+    """Создает event loop для отправки уведомлений и загружает отложенные алерты."""
+    global LOOP
+    LOOP = asyncio.new_event_loop()
+    load_failed_alerts()
+
+async def get_bot():
+    """Возвращает общий Bot, при первом вызове импортирует telegram и создает его."""
+    global BOT
+    if BOT is None:
+        from telegram import Bot
+        from telegram.request import HTTPXRequest
+
+        request = HTTPXRequest(
+            connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE,
+            http_version='2',
+            connect_timeout=5,
+            read_timeout=10,
+        )
+        BOT = Bot(token=TELEGRAM_BOT_TOKEN, request=request)
+        try:
+            await BOT.initialize()
+        except Exception as e:
+            print(f"[Telegram Error] Не удалось инициализировать бота: {e}")
+    return BOT
+
+def load_failed_alerts():
+    """Загружает в FAILED_ALERTS алерты, не отправленные при прошлых запусках."""
     try:
-        bot = Bot(token=TELEGRAM_BOT_TOKEN)
-        await bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message, parse_mode='Markdown')
-        print(f"[Telegram] Успешно отправлено уведомление.")
+        with open(FAILED_ALERTS_FILE, encoding='utf-8') as f:
+            entries = json.load(f)
+        # В старом формате файла хранился только текст - временем считаем момент сохранения файла
+        saved_at = os.path.getmtime(FAILED_ALERTS_FILE)
+        FAILED_ALERTS.extend(
+            entry if isinstance(entry, dict) else {'text': entry, 'time': saved_at} for entry in entries
+        )
+        prune_failed_alerts()
+        if FAILED_ALERTS:
+            print(f"[Telegram] Загружено неотправленных уведомлений: {len(FAILED_ALERTS)}.")
+    except FileNotFoundError:
+        pass
     except Exception as e:
-        print(f"[Telegram Error] Не удалось отправить уведомление: {e}")
+        print(f"[Telegram Error] Не удалось загрузить неотправленные уведомления: {e}")
+
+def prune_failed_alerts():
+    """Выбрасывает из FAILED_ALERTS алерты старше FAILED_ALERTS_MAX_AGE_SECONDS."""
+    cutoff = time.time() - FAILED_ALERTS_MAX_AGE_SECONDS
+    fresh = [alert for alert in FAILED_ALERTS if alert['time'] >= cutoff]
+    if len(fresh) < len(FAILED_ALERTS):
+        print(f"[Telegram] Устаревших неотправленных уведомлений выброшено: {len(FAILED_ALERTS) - len(fresh)}.")
+        FAILED_ALERTS.clear()
+        FAILED_ALERTS.extend(fresh)
+
+def save_failed_alerts():
+    """Сохраняет FAILED_ALERTS в файл, чтобы они пережили перезапуск сервиса."""
+    try:
+        with open(FAILED_ALERTS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(list(FAILED_ALERTS), f, ensure_ascii=False)
+    except Exception as e:
+        print(f"[Telegram Error] Не удалось сохранить неотправленные уведомления: {e}")
+
+async def send_telegram_alert(alert):
+    """Асинхронно отправляет алерт в Telegram, повторяя попытку при сетевых ошибках и лимитах.
+
+    alert - словарь с текстом ('text') и временем создания ('time'). Досылаемые алерты
+    ('delayed') получают пометку с исходным временем. Если все попытки исчерпаны,
+    алерт откладывается в FAILED_ALERTS.
+    """
+    from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
 
-# --- ОСНОВНОЙ ЦИКЛ АНАЛИЗАТОРА (PULL-МОДЕЛЬ) ---
+    message = alert['text']
+    if alert.get('delayed'):
+        created_at = datetime.fromtimestamp(alert['time'], timezone.utc)
+        message += DELAYED_ALERT_NOTE.format(time=created_at.strftime('%Y-%m-%d %H:%M'))
+
+    for attempt in range(TELEGRAM_SEND_ATTEMPTS):
+        try:
+            await BOT.send_message(chat_id=TELEGRAM_CHAT_ID, text=message, parse_mode='Markdown')
+            print(f"[Telegram] Успешно отправлено уведомление.")
+            return
+        except RetryAfter as e:
+            # Flood control Telegram: ждем столько, сколько он просит (число секунд или timedelta)
+            retry_after = e.retry_after
+            delay = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+            print(f"[Telegram Error] Лимит Telegram, повтор через {delay:.0f}с (попытка {attempt + 1}/{TELEGRAM_SEND_ATTEMPTS}).")
+            if attempt + 1 < TELEGRAM_SEND_ATTEMPTS:
+                await asyncio.sleep(delay)
+        except BadRequest as e:
+            # BadRequest наследует NetworkError, но повтор некорректное сообщение не исправит
+            print(f"[Telegram Error] Не удалось отправить уведомление: {e}")
+            return
+        except (TimedOut, NetworkError) as e:
+            print(f"[Telegram Error] Сетевая ошибка (попытка {attempt + 1}/{TELEGRAM_SEND_ATTEMPTS}): {e}")
+            if attempt + 1 < TELEGRAM_SEND_ATTEMPTS:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        except Exception as e:
+            # Ошибки не сетевые (например, некорректное сообщение) повтор не исправит
+            print(f"[Telegram Error] Не удалось отправить уведомление: {e}")
+            return
+
+    print("[Telegram Error] Уведомление отложено до следующего прохода.")
+    FAILED_ALERTS.append(alert)
+
+async def send_telegram_alerts(alerts):
+    """Отправляет накопленные за цикл уведомления с учетом лимита Telegram на чат."""
+    # Bot создается (и telegram импортируется) один раз до начала отправки
+    await get_bot()
+    # Строго по одному и в исходном порядке, темп задает лимитер чата
+    for alert in alerts:
+        async with TELEGRAM_RATE_LIMITER:
+            await send_telegram_alert(alert)
+    save_failed_alerts()
+
+# --- ПРОХОД АНАЛИЗА ---
+
+def run_analysis_pass(symbols=None):
+    """Один проход анализа: алерты по ускорению роста OI и удаление старых записей.
+
+    Проход идемпотентен - он всегда смотрит на текущее состояние базы, поэтому
+    любая пачка сигналов от сканера обрабатывается одним проходом.
+    Если передан symbols, анализируются только эти токены.
+    """
+    print(f"\n--- {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} | Начало цикла анализа ---")
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    if not NAME_CACHE:
+        load_token_names(conn)
+
+    oi_alerts = get_oi_alerts(conn, symbols)
+    if oi_alerts is None:
+        # Без анализа старые записи не трогаем, иначе пары для сравнения будут потеряны
+        release_db_connection(conn)
+        return
+    print(f"Найдено {len(oi_alerts)} токенов с ускорением роста OI выше порога.")
+    # Сначала досылаем еще актуальные алерты, которые не удалось отправить в прошлых проходах
+    prune_failed_alerts()
+    pending_alerts = [dict(alert, delayed=True) for alert in FAILED_ALERTS]
+    FAILED_ALERTS.clear()
+
+    for token, current_oi, prev_oi, oi_delta in oi_alerts:
+        print(f"  > Алерт {token}: Текущий рост OI {current_oi:.2f}%, Предыдущий {prev_oi:.2f}%. Дельта: {oi_delta:.2f}%")
+        message = ALERT_TMPL.format(
+            name=get_token_name(conn, token), sym=token, delta=oi_delta, cur=current_oi, prev=prev_oi
+        )
+        pending_alerts.append({'text': message, 'time': time.time()})
+
+    # Удаляем все записи, кроме самой последней по каждому токену
+    cleanup_all(conn, symbols)
+    release_db_connection(conn)
+
+    if pending_alerts:
+        LOOP.run_until_complete(send_telegram_alerts(pending_alerts))
+
+# --- ОСНОВНОЙ ЦИКЛ АНАЛИЗАТОРА (PUSH-МОДЕЛЬ: LISTEN/NOTIFY) ---
 if __name__ == "__main__":
-    print("--- ЗАПУСК СЕРВИСА-АНАЛИЗАТОРА ДИНАМИКИ OI (v2.1 - Корректное удаление) ---")
+    print("--- ЗАПУСК СЕРВИСА-АНАЛИЗАТОРА ДИНАМИКИ OI (v3.0 - Анализ по сигналам NOTIFY) ---")
     
     if not all([DATABASE_URL, TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID]):
         print("[CRITICAL] Не все переменные окружения (DATABASE_URL, TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID) установлены.")
     else:
+        init_telegram()
+        listener_conn = None
+        symbols_to_analyze = None # None - полный проход по всем токенам
         while True:
-            print(f"\n--- {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} | Начало цикла анализа ---")
-            conn = get_db_connection()
-            if conn:
-                tokens_to_process = get_tokens_to_process(conn)
-                print(f"Найдено {len(tokens_to_process)} токенов для анализа.")
-
-                for token in tokens_to_process:
-                    current_record, previous_record = get_latest_records(conn, token)
-                    
-                    if current_record and previous_record:
-                        current_id, current_name, current_oi = current_record
-                        prev_id, _, prev_oi = previous_record
-
-                        # Вычисляем дельту (разницу)
-                        oi_delta = current_oi - prev_oi
-
-                        print(f"  > Анализ {token}: Текущий рост OI {current_oi:.2f}%, Предыдущий {prev_oi:.2f}%. Дельта: {oi_delta:.2f}%")
-                        
-                        # Сравниваем ДЕЛЬТУ с порогом
-                        if oi_delta >= OI_DELTA_THRESHOLD:
-                            message = (
-                                f"🚀 *Алерт по УСКОРЕНИЮ роста OI* 🚀\n\n"
-                                f"Токен: *{current_name} ({token})*\n\n"
-                                f"🔥 Изменение роста OI за 4 часа: *{oi_delta:+.2f}%*\n"
-                                f"_(Текущий рост: {current_oi:.2f}%, Предыдущий: {prev_oi:.2f}%)_"
-                            )
-                            asyncio.run(send_telegram_alert(message))
-                        
-                        # Удаляем ВСЕ записи для этого токена, кроме самой последней
-                        cleanup_old_records(conn, current_id, token)
-
-                conn.close()
-
-            print(f"--- Анализ завершен. Следующая проверка через {CHECK_INTERVAL_SECONDS / 60:.0f} мин. ---")
-            time.sleep(CHECK_INTERVAL_SECONDS)
\ No newline at end of file
+            if listener_conn is None:
+                listener_conn = get_listener_connection()
+                # Пока подписки не было, сигналы могли потеряться - проверяем все токены
+                symbols_to_analyze = None
+
+            run_analysis_pass(symbols_to_analyze)
+
+            if listener_conn is None:
+                print(f"--- Анализ завершен. Повторная подписка на сигналы через {CHECK_INTERVAL_SECONDS / 60:.0f} мин. ---")
+                time.sleep(CHECK_INTERVAL_SECONDS)
+                continue
+
+            print("--- Анализ завершен. Ожидание сигнала о новых данных... ---")
+            try:
+                symbols_to_analyze = wait_for_new_data(listener_conn, CHECK_INTERVAL_SECONDS)
+            except Exception as e:
+                # Соединение с подпиской разорвано - переподключимся и проверим все токены
+                print(f"[DB Error] Потеряно соединение с подпиской '{LISTEN_CHANNEL}': {e}")
+                listener_conn.close()
+                listener_conn = None
@@ -1,8 +1,21 @@
+import argparse
+from collections import namedtuple
+import csv
+import io
 import requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from aiolimiter import AsyncLimiter
 from datetime import datetime, timedelta, timezone
 import os
+import orjson
 import psycopg2
+import psycopg2.pool
 from psycopg2 import sql
 
 # --- ГЛАВНАЯ КОНФИГУРАЦИЯ ---
@@ -13,31 +26,95 @@ COINMARKETCAP_API_KEY = os.environ.get('COINMARKETCAP_API_KEY')
 NUMBER_OF_TOKENS_TO_SCAN = 300
 API_DELAY_SECONDS = 2 
 
+# Запросы к Coinglass идут параллельно: не больше COINGLASS_MAX_CONCURRENT_REQUESTS одновременно
+COINGLASS_MAX_CONCURRENT_REQUESTS = 20
+COINGLASS_REQUEST_TIMEOUT_SECONDS = 15
+# Повторы при ответе 429 (Too Many Requests): пауза берется из Retry-After,
+# а без него растет: 2с, 4с, ...
+COINGLASS_MAX_RETRIES = 3
+
+# Темп запросов задает сама квота Coinglass из заголовков X-RateLimit-Remaining / X-RateLimit-Reset:
+# пока запас есть, запросы идут без пауз, а когда остается меньше COINGLASS_RATE_LIMIT_RESERVE,
+# оставшиеся запросы растягиваются до сброса окна. Пока заголовков нет (до первого ответа
+# или если API их не присылает) - прежний темп, один запрос в API_DELAY_SECONDS
+COINGLASS_RATE_LIMIT_RESERVE = 5
+# Дольше этого ждать квоту (или Retry-After) не имеет смысла: квота на сутки или месяц
+# исчерпана, и скан останавливается, а не висит часами до следующего запуска по cron
+COINGLASS_MAX_QUOTA_WAIT_SECONDS = 120
+RATE_BUDGET = {'remaining': None, 'reset_at': 0.0, 'exhausted': False}
+
+# Токены, по которым Coinglass ответил "нет данных", сутки не опрашиваются.
+# Отметки хранятся в файле (тикер -> время ответа), чтобы пережить перезапуск
+NO_DATA_CACHE_FILE = os.environ.get('NO_DATA_CACHE_FILE', 'coinglass_no_data.json')
+NO_DATA_TTL_SECONDS = 24 * 60 * 60
+NO_DATA_SYMBOLS = {}
+
+# Стейблкоины и обернутые токены не сканируются: их OI повторяет базовый актив.
+# Обернутые перечислены явно, чтобы не отбрасывать обычные токены на "W" (WIF, WLD, ...)
+STABLES = frozenset({'USDT', 'USDC', 'DAI', 'BUSD', 'TUSD', 'USDP', 'FDUSD', 'PYUSD'})
+WRAPPED = frozenset({'WBTC', 'WETH', 'WBNB', 'WTRX', 'WBETH', 'WEETH', 'WSTETH', 'WAVAX', 'WMATIC', 'WSOL'})
+# Объединенный набор: фильтр делает одну проверку на токен вместо двух
+EXCLUDED_SYMBOLS = STABLES | WRAPPED
+
+# Токен для сканирования: тикер и название с CMC
+Token = namedtuple('Token', 'symbol name')
+
 # --- КОНФИГУРАЦИЯ БАЗЫ ДАННЫХ (для Railway) ---
+# Сканеру можно указать адрес pgbouncer (режим transaction pooling): сессионного
+# состояния он не держит - временная таблица живет до COMMIT, PREPARE не используется
 DATABASE_URL = os.environ.get('DATABASE_URL')
+DB_POOL_MIN_CONN = 1
+DB_POOL_MAX_CONN = 2
+POOL = None
 
 # --- БАЗОВЫЕ URL API ---
 CMC_BASE_URL = 'https://pro-api.coinmarketcap.com/v1'
 COINGLASS_BASE_URL_V4 = 'https://open-api-v4.coinglass.com/api/futures'
 
+# --- HTTP-СЕССИЯ ДЛЯ CMC ---
+# Одна сессия с keep-alive вместо нового TCP+TLS соединения на каждый запрос,
+# плюс автоматические повторы при лимитах и ошибках сервера.
+# Успешные ответы кэшируются на диске. Состав топ-N по капитализации за час почти
+# не меняется, поэтому запуски по cron в течение часа обходятся без запроса к CMC
+HTTP_CACHE_FILE = 'oi_cache.sqlite'
+HTTP_CACHE_EXPIRE_AFTER = timedelta(hours=1)
+SESSION = requests_cache.CachedSession(
+    HTTP_CACHE_FILE,
+    expire_after=HTTP_CACHE_EXPIRE_AFTER,
+    allowable_methods=['GET'],
+    allowable_codes=[200],
+    cache_control=False,
+    # Ключ API не участвует в ключе кэша и не сохраняется на диск
+    ignored_parameters=['X-CMC_PRO_API_KEY'],
+)
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+))
+SESSION.headers.update({'Accepts': 'application/json', 'X-CMC_PRO_API_KEY': COINMARKETCAP_API_KEY})
+
 # --- ФУНКЦИИ-СБОРЩИКИ ДАННЫХ ---
 
 def get_top_symbols():
     """Получает с CoinMarketCap список топ-N токенов для сканирования."""
     print(f"[CMC] Получение списка топ-{NUMBER_OF_TOKENS_TO_SCAN} токенов...")
     url = f"{CMC_BASE_URL}/cryptocurrency/listings/latest"
-    headers = {'Accepts': 'application/json', 'X-CMC_PRO_API_KEY': COINMARKETCAP_API_KEY}
-    params = {'limit': NUMBER_OF_TOKENS_TO_SCAN}
+    # Из всего ответа нужны только тикер и название: aux отключает необязательные поля
+    # (теги, платформу, данные о предложении), и ответ становится в разы меньше
+    params = {'limit': NUMBER_OF_TOKENS_TO_SCAN, 'aux': 'cmc_rank'}
     try:
-        response = requests.get(url, headers=headers, params=params)
+        response = SESSION.get(url, params=params)
+        if response.from_cache:
+            print("[CMC] Список токенов взят из локального кэша.")
         # Проверяем, что запрос вообще прошел успешно (код 200)
         response.raise_for_status() 
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Проверяем, есть ли в ответе ключ 'data', или это сообщение об ошибке
         if 'data' in data:
-            stablecoins = ['USDT', 'USDC', 'DAI', 'BUSD', 'TUSD', 'USDP']
-            symbols = [{'symbol': item['symbol'], 'name': item['name']} for item in data['data'] if item['symbol'] not in stablecoins and not item['symbol'].startswith('W')]
+            excluded = EXCLUDED_SYMBOLS
+            symbols = [Token(symbol, item['name']) for item in data['data'] if (symbol := item['symbol']) not in excluded]
             print(f"[CMC] Успешно получено {len(symbols)} торговых символов.")
             return symbols
         else:
@@ -54,34 +131,155 @@ def get_top_symbols():
         print(f"[CMC] КРИТИЧЕСКАЯ ОШИБКА: {e}")
         return []
 
-def get_oi_growth_from_coinglass(symbol):
-    """Получает и рассчитывает 4ч рост OI через Coinglass."""
+def pct_change(new_value, old_value):
+    """Изменение в процентах от old_value к new_value; None, если база не положительная."""
+    if old_value > 0:
+        return (new_value - old_value) / old_value * 100
+    return None
+
+def update_rate_budget(headers):
+    """Обновляет RATE_BUDGET по заголовкам квоты из ответа Coinglass.
+
+    Внутри текущего окна остаток только уменьшается: число из заголовка не учитывает
+    запросы, которые еще в пути, но уже списаны в wait_for_rate_budget.
+    """
+    remaining = headers.get('X-RateLimit-Remaining')
+    reset = headers.get('X-RateLimit-Reset')
+    if remaining is None or reset is None:
+        return
+    try:
+        remaining = int(remaining)
+        reset = float(reset)
+    except ValueError:
+        return
+    # Сброс окна приходит как unix-время в миллисекундах или секундах, либо как число секунд до него
+    if reset > 1e11:
+        reset_at = reset / 1000
+    elif reset > 1e9:
+        reset_at = reset
+    else:
+        reset_at = time.time() + reset
+
+    if RATE_BUDGET['remaining'] is None or time.time() >= RATE_BUDGET['reset_at']:
+        RATE_BUDGET['remaining'] = remaining
+        RATE_BUDGET['reset_at'] = reset_at
+    else:
+        RATE_BUDGET['remaining'] = min(RATE_BUDGET['remaining'], remaining)
+
+def mark_quota_exhausted(wait_seconds):
+    """Отмечает, что квота Coinglass исчерпана надолго, и скан нужно остановить."""
+    if not RATE_BUDGET['exhausted']:
+        RATE_BUDGET['exhausted'] = True
+        print(f"\n[Coinglass] Квота исчерпана, до ее восстановления {wait_seconds:.0f}с - оставшиеся токены не опрашиваются.")
+
+async def wait_for_rate_budget(rate_limiter, budget_lock):
+    """Ждет, пока квота Coinglass позволит отправить следующий запрос.
+
+    Проверка остатка, пауза и списание запроса идут под budget_lock, поэтому
+    параллельные задачи получают слоты по очереди и не выходят за квоту.
+    Возвращает False, если ждать пришлось бы дольше COINGLASS_MAX_QUOTA_WAIT_SECONDS.
+    """
+    async with budget_lock:
+        if RATE_BUDGET['exhausted']:
+            return False
+        if RATE_BUDGET['remaining'] is not None and time.time() >= RATE_BUDGET['reset_at']:
+            # Окно квоты сбросилось - новый остаток узнаем из следующего ответа
+            RATE_BUDGET['remaining'] = None
+        remaining = RATE_BUDGET['remaining']
+        if remaining is not None:
+            if remaining < COINGLASS_RATE_LIMIT_RESERVE:
+                # Оставшиеся запросы равномерно растягиваются до сброса окна
+                delay = max(0.0, RATE_BUDGET['reset_at'] - time.time()) / max(remaining, 1)
+                if delay > COINGLASS_MAX_QUOTA_WAIT_SECONDS:
+                    mark_quota_exhausted(RATE_BUDGET['reset_at'] - time.time())
+                    return False
+                await asyncio.sleep(delay)
+            # Запрос списывается с квоты до отправки, не дожидаясь ответа
+            RATE_BUDGET['remaining'] -= 1
+            return True
+    await rate_limiter.acquire()
+    return True
+
+async def get_oi_growth_from_coinglass(session, rate_limiter, budget_lock, symbol):
+    """Асинхронно получает и рассчитывает 4ч рост OI через Coinglass."""
     url = f"{COINGLASS_BASE_URL_V4}/open-interest/aggregated-history"
-    headers = {'CG-API-KEY': COINGLASS_API_KEY}
     params = {'symbol': symbol, 'interval': 'h4', 'limit': 2}
     try:
-        response = requests.get(url, headers=headers, params=params).json()
-        if str(response.get('code')) == '0' and len(response.get('data', [])) == 2:
+        retry_delay = API_DELAY_SECONDS
+        for attempt in range(COINGLASS_MAX_RETRIES + 1):
+            if attempt:
+                # Coinglass ответил 429 - ждем и пробуем снова
+                await asyncio.sleep(retry_delay)
+            if not await wait_for_rate_budget(rate_limiter, budget_lock):
+                return None
+            async with session.get(url, params=params) as http_response:
+                update_rate_budget(http_response.headers)
+                if http_response.status == 429:
+                    retry_after = http_response.headers.get('Retry-After', '')
+                    retry_delay = float(retry_after) if retry_after.isdigit() else API_DELAY_SECONDS * 2 ** attempt
+                    if retry_delay > COINGLASS_MAX_QUOTA_WAIT_SECONDS:
+                        mark_quota_exhausted(retry_delay)
+                        return None
+                    continue
+                response = orjson.loads(await http_response.read())
+                break
+        else:
+            return None
+
+        if response.get('code') in (0, '0') and len(response.get('data') or ()) == 2:
             data_points = response['data']
-            oi_today = float(data_points[-1]['close'])
-            oi_4h_ago = float(data_points[-2]['close'])
-            if oi_4h_ago > 0:
-                return ((oi_today - oi_4h_ago) / oi_4h_ago) * 100
+            NO_DATA_SYMBOLS.pop(symbol, None)
+            return pct_change(float(data_points[-1]['close']), float(data_points[-2]['close']))
+        if response.get('code') in (0, '0'):
+            # Запрос успешен, но истории по токену нет - запоминаем, чтобы не спрашивать снова.
+            # Ошибки сети и лимиты сюда не попадают: такие токены проверим в следующий раз
+            NO_DATA_SYMBOLS[symbol] = time.time()
         return None
     except Exception:
         return None
 
+def load_no_data_symbols():
+    """Загружает в NO_DATA_SYMBOLS еще не устаревшие отметки "нет данных"."""
+    try:
+        with open(NO_DATA_CACHE_FILE, 'rb') as f:
+            marks = orjson.loads(f.read())
+        now = time.time()
+        NO_DATA_SYMBOLS.update({symbol: ts for symbol, ts in marks.items() if now - ts < NO_DATA_TTL_SECONDS})
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[CACHE] Не удалось загрузить список токенов без данных: {e}")
+
+def save_no_data_symbols():
+    """Сохраняет NO_DATA_SYMBOLS в файл для следующих запусков."""
+    try:
+        with open(NO_DATA_CACHE_FILE, 'wb') as f:
+            f.write(orjson.dumps(NO_DATA_SYMBOLS))
+    except Exception as e:
+        print(f"[CACHE] Не удалось сохранить список токенов без данных: {e}")
+
 # --- ФУНКЦИИ ДЛЯ РАБОТЫ С БАЗОЙ ДАННЫХ ---
 
 def get_db_connection():
-    """Устанавливает соединение с базой данных PostgreSQL."""
+    """Берет соединение с PostgreSQL из пула (пул создается при первом вызове)."""
+    global POOL
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        return conn
+        if POOL is None:
+            POOL = psycopg2.pool.ThreadedConnectionPool(
+                minconn=DB_POOL_MIN_CONN, maxconn=DB_POOL_MAX_CONN, dsn=DATABASE_URL
+            )
+        return POOL.getconn()
     except Exception as e:
         print(f"[DB Error] Не удалось подключиться к базе данных: {e}")
         return None
 
+def release_db_connection(conn):
+    """Возвращает соединение в пул. Разорванные соединения пул закрывает и не выдает повторно."""
+    try:
+        POOL.putconn(conn, close=bool(conn.closed))
+    except Exception as e:
+        print(f"[DB Error] Не удалось вернуть соединение в пул: {e}")
+
 def setup_database(conn):
     """Создает таблицу для данных OI, если она еще не существует. НЕ ОЧИЩАЕТ ДАННЫЕ."""
     try:
@@ -94,78 +292,154 @@ def setup_database(conn):
                     scan_time TIMESTAMPTZ DEFAULT NOW(),
                     token_symbol VARCHAR(20) NOT NULL,
                     token_name TEXT,
-                    oi_growth_4h FLOAT,
-                    UNIQUE(token_symbol, scan_time)
+                    oi_growth_4h FLOAT
                 );
             """)
+            # Один уникальный индекс и для запросов анализатора, и для проверки дубликатов:
+            # "последние записи по токену" читаются прямо из индекса (Index Only Scan)
+            # без сортировки, а при вставке обновляется только он один
+            cur.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS oi_data_sym_time_key
+                ON oi_data (token_symbol, scan_time DESC) INCLUDE (id, token_name, oi_growth_4h);
+            """)
+            # В старых версиях схемы уникальность проверялась отдельным ограничением,
+            # а для чтения был второй индекс - теперь оба лишние. Сначала смотрим в каталог:
+            # ALTER TABLE берет ACCESS EXCLUSIVE блокировку еще до проверки IF EXISTS и
+            # на каждом запуске ненадолго блокировал бы чтение анализатором
+            cur.execute("""
+                SELECT 1 FROM pg_constraint
+                WHERE conrelid = 'oi_data'::regclass AND conname = 'oi_data_token_symbol_scan_time_key';
+            """)
+            if cur.fetchone():
+                cur.execute("ALTER TABLE oi_data DROP CONSTRAINT oi_data_token_symbol_scan_time_key;")
+            cur.execute("SELECT to_regclass('oi_data_sym_time_idx') IS NOT NULL;")
+            if cur.fetchone()[0]:
+                cur.execute("DROP INDEX oi_data_sym_time_idx;")
             conn.commit()
-            print("[DB] Проверка: таблица 'oi_data' существует.")
+            print("[DB] Проверка: таблица 'oi_data' и ее индексы существуют.")
     except Exception as e:
         print(f"[DB Error] Не удалось проверить/создать таблицу: {e}")
         conn.rollback()
 
 # ПАТЧ для oi_collect.py
-def insert_oi_data(conn, data_list):
-    """Вставляет данные и отправляет NOTIFY сигнал."""
-    if not data_list:
-        return
-    
-    query = "INSERT INTO oi_data (token_symbol, token_name, oi_growth_4h) VALUES (%s, %s, %s);"
-    records_to_insert = [(item['symbol'], item['name'], item['oi_growth']) for item in data_list]
-    
+def insert_oi_data(conn, rows):
+    """Одной транзакцией вставляет строки (тикер, название, рост OI) и отправляет NOTIFY
+    сигнал с символом каждого записанного токена. При ошибке не записывается ничего."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
     try:
         with conn.cursor() as cur:
-            cur.executemany(query, records_to_insert)
-            # Отправляем сигнал после успешной вставки
-            cur.execute("NOTIFY new_data_event;")
+            # Строки заливаются через COPY во временную таблицу, а оттуда одним INSERT
+            # переносятся в oi_data: так дубликаты по уникальному индексу просто пропускаются
+            cur.execute("""
+                CREATE TEMP TABLE oi_stage (
+                    token_symbol VARCHAR(20) NOT NULL,
+                    token_name TEXT,
+                    oi_growth_4h FLOAT
+                ) ON COMMIT DROP;
+            """)
+            cur.copy_expert("COPY oi_stage (token_symbol, token_name, oi_growth_4h) FROM STDIN WITH (FORMAT csv)", buffer)
+            cur.execute("""
+                INSERT INTO oi_data (token_symbol, token_name, oi_growth_4h)
+                SELECT token_symbol, token_name, oi_growth_4h FROM oi_stage
+                ON CONFLICT DO NOTHING;
+            """)
+            inserted = cur.rowcount
+            # Отправляем сигналы после успешной вставки: анализатор проверит только эти токены
+            cur.execute("SELECT pg_notify('new_data_event', token_symbol) FROM oi_stage;")
             conn.commit()
-            print(f"[DB] Успешно записано {len(records_to_insert)} строк и отправлен NOTIFY.")
+            print(f"[DB] Успешно записано {inserted} строк и отправлен NOTIFY.")
     except Exception as e:
         print(f"[DB Error] Не удалось записать данные: {e}")
         conn.rollback()
 
+def prepare_database():
+    """Подключается к БД и проверяет таблицу. Возвращает соединение или None."""
+    conn = get_db_connection()
+    if conn:
+        setup_database(conn)
+    return conn
+
+# --- СКАНИРОВАНИЕ ---
+
+async def scan_oi_growth(conn, symbols_to_scan):
+    """Параллельно опрашивает Coinglass по всем токенам и одной транзакцией пишет результаты в БД."""
+    results = []
+
+    load_no_data_symbols()
+    skipped = len(symbols_to_scan)
+    symbols_to_scan = [token_info for token_info in symbols_to_scan if token_info.symbol not in NO_DATA_SYMBOLS]
+    skipped -= len(symbols_to_scan)
+    if skipped:
+        print(f"[CACHE] Пропущено токенов без данных на Coinglass: {skipped}.")
+
+    semaphore = asyncio.Semaphore(COINGLASS_MAX_CONCURRENT_REQUESTS)
+    rate_limiter = AsyncLimiter(1, API_DELAY_SECONDS)
+    budget_lock = asyncio.Lock()
+    connector = aiohttp.TCPConnector(limit=100, limit_per_host=COINGLASS_MAX_CONCURRENT_REQUESTS)
+    timeout = aiohttp.ClientTimeout(total=COINGLASS_REQUEST_TIMEOUT_SECONDS)
+    headers = {'CG-API-KEY': COINGLASS_API_KEY}
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+        async def fetch(token_info):
+            async with semaphore:
+                return token_info, await get_oi_growth_from_coinglass(session, rate_limiter, budget_lock, token_info.symbol)
+
+        tasks = [fetch(token_info) for token_info in symbols_to_scan]
+        for i, task in enumerate(asyncio.as_completed(tasks), 1):
+            token_info, oi_growth = await task
+            if oi_growth is None and RATE_BUDGET['exhausted']:
+                # Токен не опрашивался - квота исчерпана
+                continue
+            token, token_name = token_info
+            print(f"({i}/{len(symbols_to_scan)}) {token} ({token_name}):", end="")
+
+            if oi_growth is not None:
+                print(f" Рост OI за 4ч: {oi_growth:.2f}%")
+                results.append((token_info, oi_growth))
+            else:
+                print(" нет данных по OI.")
+
+    # Все результаты скана пишутся в конце одним COMMIT: прерванный скан не оставляет
+    # в БД половину токенов, а строки для COPY собираются генератором без промежуточного списка
+    if results:
+        print(f"--- [DB] Запись {len(results)} токенов в базу данных... ---")
+        insert_oi_data(conn, ((token, token_name, oi_growth) for (token, token_name), oi_growth in results))
+    save_no_data_symbols()
+
 # --- ОСНОВНОЙ СКРИПТ OI СКАНЕР ---
 if __name__ == "__main__":
-    print("--- ЗАПУСК СКАНЕРА РОСТА OI С ЗАПИСЬЮ В БД (v2 - Порционная запись) ---")
+    parser = argparse.ArgumentParser(description="Сканер роста OI с записью в БД.")
+    parser.add_argument('--bust-cache', action='store_true', help="очистить локальный кэш ответов API перед запуском")
+    args = parser.parse_args()
+    if args.bust_cache:
+        SESSION.cache.clear()
+        if os.path.exists(NO_DATA_CACHE_FILE):
+            os.remove(NO_DATA_CACHE_FILE)
+        print("[CACHE] Локальный кэш ответов API очищен.")
+
+    print("--- ЗАПУСК СКАНЕРА РОСТА OI С ЗАПИСЬЮ В БД (v3 - Параллельный опрос Coinglass) ---")
     
     if not DATABASE_URL:
         print("[CRITICAL] Переменная окружения DATABASE_URL не установлена. Завершение работы.")
     else:
-        conn = get_db_connection()
-        if conn:
-            setup_database(conn)
-
+        # Подключение к БД и проверка таблицы идут в фоне, пока ждем ответ CMC
+        with ThreadPoolExecutor(max_workers=1) as db_executor:
+            db_ready = db_executor.submit(prepare_database)
             symbols_to_scan = get_top_symbols()
-            
-            # ИЗМЕНЕНО: Создаем временный список для порции данных
-            data_batch = []
-            BATCH_SIZE = 20 # Будем записывать в БД каждые 20 токенов
-
-            for i, token_info in enumerate(symbols_to_scan, 1):
-                token = token_info['symbol']
-                token_name = token_info['name']
-                print(f"({i}/{len(symbols_to_scan)}) Сканирование {token} ({token_name})...", end="")
-                
-                oi_growth = get_oi_growth_from_coinglass(token)
-                time.sleep(API_DELAY_SECONDS)
-                
-                if oi_growth is not None:
-                    print(f" Рост OI за 4ч: {oi_growth:.2f}%")
-                    # Добавляем данные в порцию
-                    data_batch.append({'symbol': token, 'name': token_name, 'oi_growth': oi_growth})
-                else:
-                    print(" нет данных по OI.")
-
-                # ИЗМЕНЕНО: Проверяем, не пора ли записать порцию в БД
-                if i % BATCH_SIZE == 0 or i == len(symbols_to_scan):
-                    if data_batch:
-                        print(f"--- [DB] Запись порции из {len(data_batch)} токенов в базу данных... ---")
-                        insert_oi_data(conn, data_batch)
-                        data_batch = [] # Очищаем порцию
+            conn = db_ready.result()
+
+        if conn:
+            asyncio.run(scan_oi_growth(conn, symbols_to_scan))
             
             # --- Итоговый ТОП-список больше не нужен, т.к. все данные уже в БД ---
             
-            conn.close()
+            release_db_connection(conn)
+            POOL.closeall()
             print("[DB] Соединение с базой данных закрыто.")
 
+        SESSION.close()
+
     print("\nАнализ и запись завершены.")
\ No newline at end of file